@@ -0,0 +1,70 @@
+# Memory benchmark: per-result dicts vs slotted Article records vs columnar ArticleBatch
+# Run with: python bench_article_memory.py [num_articles]
+
+import sys
+import tracemalloc
+
+from scigappubmedv6 import Article, ArticleBatch
+
+JOURNALS = ["The Lancet", "BMJ", "JAMA", "N Engl J Med", "PLoS One", "Cochrane Database Syst Rev"]
+
+def make_raw_records(n: int) -> list:
+    """Title/abstract/journal text as it comes out of the XML parser (shared by every layout)"""
+    return [
+        (
+            str(30000000 + i),
+            f"Study {i} of intervention outcomes",
+            f"Abstract {i}: background, methods, results and conclusions.",
+            # Parsed text is a fresh string per record, just like ElementTree output
+            "".join(JOURNALS[i % len(JOURNALS)]),
+            2000 + i % 25
+        )
+        for i in range(n)
+    ]
+
+def build_dicts(raw: list) -> list:
+    return [
+        {
+            'title': title,
+            'snippet': abstract,
+            'link': f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
+            'pmid': f"PMID: {pmid}",
+            'journal': journal
+        }
+        for pmid, title, abstract, journal, year in raw
+    ]
+
+def build_articles(raw: list) -> list:
+    return [Article(int(pmid), title, abstract, journal, year) for pmid, title, abstract, journal, year in raw]
+
+def build_batch(raw: list) -> ArticleBatch:
+    batch = ArticleBatch()
+    for pmid, title, abstract, journal, year in raw:
+        batch.append(Article(int(pmid), title, abstract, journal, year))
+    return batch
+
+def measure(builder, raw: list) -> int:
+    """Bytes retained by the structure built on top of the raw text"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = builder(raw)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    raw = make_raw_records(n)
+
+    print(f"Retained memory for {n:,} articles (excluding shared title/abstract text):")
+    baseline = None
+    for label, builder in [("dict records", build_dicts),
+                           ("Article (slots)", build_articles),
+                           ("ArticleBatch (columnar)", build_batch)]:
+        used = measure(builder, raw)
+        baseline = baseline or used
+        print(f"  {label:<25} {used / 1024 / 1024:8.2f} MiB  ({used / n:6.1f} B/article, {used / baseline:5.1%} of dicts)")
+
+if __name__ == "__main__":
+    main()
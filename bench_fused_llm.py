@@ -0,0 +1,80 @@
+# Latency benchmark and side-by-side output comparison: two-call vs fused LLM mode
+# Run with: python bench_fused_llm.py "topic" [runs]
+# Uses OPENROUTER_API_KEY / PUBMED_API_KEY from the environment, else the app defaults.
+
+import os
+import sys
+import textwrap
+import time
+
+import streamlit as st
+
+import scigappubmedv6 as app
+
+COLUMN_WIDTH = 60
+
+def run_two_call(search_results):
+    summary = app.summarize_search_results(search_results)
+    gap_analysis = app.analyze_knowledge_gaps(summary, app.GAP_ANALYSIS_PROMPT)
+    return summary or "", gap_analysis or ""
+
+def run_fused(search_results):
+    return app.summarize_and_analyze(search_results)
+
+def timed(fn, search_results):
+    start = time.perf_counter()
+    summary, gap_analysis = fn(search_results)
+    return time.perf_counter() - start, summary, gap_analysis
+
+def print_side_by_side(label: str, left: str, right: str):
+    left_lines = textwrap.wrap(left or "-", COLUMN_WIDTH) or ["-"]
+    right_lines = textwrap.wrap(right or "-", COLUMN_WIDTH) or ["-"]
+    print(f"\n== {label} " + "=" * (2 * COLUMN_WIDTH - len(label)))
+    for i in range(max(len(left_lines), len(right_lines))):
+        l = left_lines[i] if i < len(left_lines) else ""
+        r = right_lines[i] if i < len(right_lines) else ""
+        print(f"{l:<{COLUMN_WIDTH}} | {r}")
+
+def main():
+    topic = sys.argv[1] if len(sys.argv) > 1 else "statins and dementia risk"
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    st.session_state.openrouter_api_key = os.environ.get("OPENROUTER_API_KEY", app.DEFAULT_OPENROUTER_API_KEY)
+    st.session_state.pubmed_api_key = os.environ.get("PUBMED_API_KEY", app.DEFAULT_PUBMED_API_KEY)
+    st.session_state.elink_cache = {}
+
+    search_results = app.search_pubmed_api(topic, num_results=10)
+    if not search_results:
+        print("No PubMed results; cannot benchmark.")
+        return
+    print(f"Benchmarking {runs} run(s) per mode on {len(search_results)} PubMed results for '{topic}'")
+
+    timings = {"two-call": [], "fused": []}
+    outputs = {}
+    for _ in range(runs):
+        for mode, fn in [("two-call", run_two_call), ("fused", run_fused)]:
+            elapsed, summary, gap_analysis = timed(fn, search_results)
+            timings[mode].append(elapsed)
+            outputs[mode] = (summary, gap_analysis)
+
+    print(f"\n{'mode':<10} {'mean s':>8} {'min s':>8} {'max s':>8}")
+    for mode, values in timings.items():
+        print(f"{mode:<10} {sum(values) / len(values):8.2f} {min(values):8.2f} {max(values):8.2f}")
+    two_call_mean = sum(timings["two-call"]) / runs
+    fused_mean = sum(timings["fused"]) / runs
+    if two_call_mean:
+        print(f"fused / two-call latency: {fused_mean / two_call_mean:.0%}")
+
+    # Compare the last run's outputs field by field
+    print(f"\n{'TWO-CALL':<{COLUMN_WIDTH}} | FUSED")
+    two_summary, two_analysis = outputs["two-call"]
+    fused_summary, fused_analysis = outputs["fused"]
+    print_side_by_side("Summary", two_summary, fused_summary)
+    two_fields = app.extract_gap_info(two_analysis, topic)
+    fused_fields = app.extract_gap_info(fused_analysis, topic)
+    for label, left, right in zip(["Gap found", "Meta-analysis title", "Gap", "Refined query"],
+                                  two_fields, fused_fields):
+        print_side_by_side(label, str(left), str(right))
+
+if __name__ == "__main__":
+    main()
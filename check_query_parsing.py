@@ -0,0 +1,29 @@
+# Quick check that refined-query parsing keeps PubMed syntax intact
+# Run with: python check_query_parsing.py
+
+from scigappubmedv6 import parse_refined_query_line
+
+CASES = [
+    # (streamed line, query that must reach esearch)
+    ('- Refined PubMed Query: statins AND "dementia 2"', 'statins AND "dementia 2"'),
+    ('Refined PubMed Query: "heart failure" AND "statins"', '"heart failure" AND "statins"'),
+    ('Refined PubMed Query: statins AND dementia*', 'statins AND dementia*'),
+    ('- **Refined PubMed Query:** statins AND dementia*', 'statins AND dementia*'),
+    ('**Refined PubMed Query**: asthma children', 'asthma children'),
+    ('Refined PubMed Query: `asthma AND children`', 'asthma AND children'),
+    ("Refined Query: 'asthma children'", 'asthma children'),
+    ('- Gap: no refined query on this line', ''),
+]
+
+def main():
+    failures = 0
+    for line, expected in CASES:
+        parsed = parse_refined_query_line(line)
+        status = "ok  " if parsed == expected else "FAIL"
+        failures += parsed != expected
+        print(f"{status} {line!r} -> {parsed!r}")
+    print(f"{len(CASES) - failures}/{len(CASES)} passed")
+    raise SystemExit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
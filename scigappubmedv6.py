@@ -19,6 +19,13 @@ from urllib.parse import quote_plus
 from bs4 import BeautifulSoup
 import xml.etree.ElementTree as ET
 import base64
+import gzip
+import io
+import threading
+from array import array
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 import streamlit.components.v1 as components
 
 # Initialize session state for API keys
@@ -33,6 +40,8 @@ def initialize_session_state():
         st.session_state.show_pubmed_help = False
     if 'experiment_running' not in st.session_state:
         st.session_state.experiment_running = False
+    if 'elink_cache' not in st.session_state:
+        st.session_state.elink_cache = {}
 
 # Check and install required packages
 def install_package(package):
@@ -45,6 +54,14 @@ except ImportError:
     install_package("openai")
     import openai
 
+# Parquet export is optional and only offered when pyarrow is available
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
 # Initialize OpenRouter client for DeepSeek access
 def get_openrouter_client():
     return openai.OpenAI(
@@ -56,18 +73,24 @@ def get_openrouter_client():
         }
     )
 
-def get_deepseek_response(prompt: str, max_attempts=3) -> str:
+DEEPSEEK_MODEL = "deepseek/deepseek-chat-v3.1:free"  # Updated model name
+DEEPSEEK_MAX_TOKENS = 2000
+# The fused call replaces two completions, so it gets the budget of both
+FUSED_MAX_TOKENS = 4000
+DEEPSEEK_SYSTEM_PROMPT = "You are a helpful research assistant specializing in meta-analysis knowledge gap identification using ONLY PubMed sources. Always provide a refined search for the next iteration."
+
+def get_deepseek_response(prompt: str, max_attempts=3, max_tokens=DEEPSEEK_MAX_TOKENS) -> str:
     """Get response from DeepSeek via OpenRouter with retries"""
     for attempt in range(max_attempts):
         try:
             client = get_openrouter_client()
             response = client.chat.completions.create(
-                model="deepseek/deepseek-chat-v3.1:free",  # Updated model name
+                model=DEEPSEEK_MODEL,
                 messages=[
-                    {"role": "system", "content": "You are a helpful research assistant specializing in meta-analysis knowledge gap identification using ONLY PubMed sources. Always provide a refined search for the next iteration."},
+                    {"role": "system", "content": DEEPSEEK_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=2000,
+                max_tokens=max_tokens,
                 temperature=0.7
             )
             return response.choices[0].message.content.strip()
@@ -78,17 +101,328 @@ def get_deepseek_response(prompt: str, max_attempts=3) -> str:
     st.error("⚠️ Failed to get response from DeepSeek API after multiple attempts.")
     return None
 
-def search_pubmed_api(query: str, num_results=10) -> list:
-    """Search PubMed using the NCBI E-utilities API"""
-    results = []
+def stream_deepseek_response(prompt: str, max_attempts=3, max_tokens=DEEPSEEK_MAX_TOKENS):
+    """Yield text chunks from DeepSeek via OpenRouter as they are generated"""
+    for attempt in range(max_attempts):
+        started = False
+        try:
+            client = get_openrouter_client()
+            stream = client.chat.completions.create(
+                model=DEEPSEEK_MODEL,
+                messages=[
+                    {"role": "system", "content": DEEPSEEK_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=0.7,
+                stream=True
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    started = True
+                    yield delta
+            return
+        except Exception as e:
+            # Retrying after text has been shown would duplicate it, so keep what we have
+            if started:
+                st.warning(f"DeepSeek stream interrupted: {str(e)}")
+                return
+            st.warning(f"Attempt {attempt+1} failed: {str(e)}")
+            if attempt < max_attempts - 1:
+                time.sleep(2)
+    st.error("⚠️ Failed to get response from DeepSeek API after multiple attempts.")
+
+def parse_refined_query_line(line: str) -> str:
+    """Return the query from a complete 'Refined PubMed Query:' line, or an empty string"""
+    # Markdown bold is only stripped around the label, so a trailing truncation wildcard survives
+    match = re.match(r"^[\s\-*#]*refined\s*(?:pubmed\s*)?query\s*\**\s*:\s*\**\s*(.+?)\s*$", line, re.IGNORECASE)
+    if not match:
+        return ""
+    query = match.group(1)
+    
+    # Only unwrap a single pair that encloses the whole query, never phrase-search quotes inside it
+    if len(query) > 2 and query[0] == query[-1]:
+        wrapper = query[0]
+        if wrapper == "`" or (wrapper in "\"'" and wrapper not in query[1:-1]):
+            query = query[1:-1].strip()
+    return query
+
+class RefinedQueryWatcher:
+    """Incrementally scan streamed text and act on the refined query once its line is complete"""
+    
+    def __init__(self, on_query=None):
+        self.on_query = on_query
+        self.buffer = ""
+        self.query = ""
+        self.result = None
+    
+    def feed(self, text: str):
+        if self.query:
+            return
+        self.buffer += text
+        # Only the trailing partial line is kept between chunks
+        while "\n" in self.buffer and not self.query:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.check(line)
+    
+    def close(self):
+        if not self.query and self.buffer:
+            self.check(self.buffer)
+        self.buffer = ""
+    
+    def check(self, line: str):
+        query = parse_refined_query_line(line)
+        if query:
+            self.query = query
+            if self.on_query:
+                self.result = self.on_query(query)
+
+# Minimum number of new characters between live re-renders of a streamed response
+STREAM_RENDER_CHARS = 200
+
+def stream_to_placeholder(prompt: str, placeholder, watcher: RefinedQueryWatcher = None,
+                          max_tokens=DEEPSEEK_MAX_TOKENS) -> str:
+    """Render a streamed DeepSeek completion live in a placeholder and return the full text"""
+    text = ""
+    rendered_length = 0
+    for chunk in stream_deepseek_response(prompt, max_tokens=max_tokens):
+        text += chunk
+        if watcher:
+            watcher.feed(chunk)
+        # Each render resends the whole text, so only refresh on new lines or every few hundred characters
+        if "\n" in chunk or len(text) - rendered_length >= STREAM_RENDER_CHARS:
+            placeholder.info(text + " ▌")
+            rendered_length = len(text)
+    if watcher:
+        watcher.close()
+    
+    text = text.strip()
+    if not text:
+        return None
+    placeholder.info(text)
+    return text
+
+@dataclass(slots=True)
+class Article:
+    """A single PubMed record with an integer PMID and interned journal name"""
+    pmid: int
+    title: str
+    snippet: str
+    journal: str = ""
+    year: int = 0
+    
+    def __post_init__(self):
+        # Many records share a journal, so keep one copy of each name
+        self.journal = sys.intern(self.journal)
+    
+    @property
+    def link(self) -> str:
+        return f"https://pubmed.ncbi.nlm.nih.gov/{self.pmid}/"
+    
+    @property
+    def pmid_label(self) -> str:
+        return f"PMID: {self.pmid}"
+
+class ArticleBatch:
+    """Columnar, array-backed storage for a whole PubMed result set"""
+    __slots__ = ('pmids', 'years', 'titles', 'snippets', 'journals')
+    
+    def __init__(self, articles=()):
+        self.pmids = array('q')
+        self.years = array('H')
+        self.titles = []
+        self.snippets = []
+        self.journals = []
+        self.extend(articles)
+    
+    def append(self, article: Article):
+        self.pmids.append(article.pmid)
+        self.years.append(article.year)
+        self.titles.append(article.title)
+        self.snippets.append(article.snippet)
+        self.journals.append(sys.intern(article.journal))
+    
+    def extend(self, articles):
+        if isinstance(articles, ArticleBatch):
+            # Column-wise copy avoids materializing an Article per record
+            self.pmids.extend(articles.pmids)
+            self.years.extend(articles.years)
+            self.titles.extend(articles.titles)
+            self.snippets.extend(articles.snippets)
+            self.journals.extend(articles.journals)
+            return
+        for article in articles:
+            self.append(article)
+    
+    def __len__(self) -> int:
+        return len(self.pmids)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ArticleBatch(self[i] for i in range(*index.indices(len(self))))
+        return Article(self.pmids[index], self.titles[index], self.snippets[index],
+                       self.journals[index], self.years[index])
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def parse_pmid(value) -> int:
+    """Turn a PMID string such as 'PMID: 12345678' into an integer (0 if missing)"""
+    digits = re.sub(r"\D", "", str(value or ""))
+    return int(digits) if digits else 0
+
+# Publication type filters offered in the sidebar, mapped to PubMed [pt] tags
+PUBMED_PUBLICATION_TYPES = {
+    "Randomized Controlled Trial": "Randomized Controlled Trial",
+    "Systematic Review": "Systematic Review",
+    "Meta-Analysis": "Meta-Analysis",
+    "Clinical Trial": "Clinical Trial",
+    "Review": "Review",
+}
+
+# Languages offered in the sidebar, mapped to PubMed [lang] values
+PUBMED_LANGUAGES = {
+    "Any": "",
+    "English": "english",
+    "French": "french",
+    "German": "german",
+    "Spanish": "spanish",
+    "Chinese": "chinese",
+    "Japanese": "japanese",
+}
+
+# Evidence-level publication types that get a ranking boost in the pre-screen
+PRESCREEN_PREFERRED_PUBTYPES = {"meta-analysis", "systematic review", "randomized controlled trial"}
+
+def build_pubmed_term(query: str, filters: dict = None) -> str:
+    """Push sidebar filters down into the esearch term so NCBI does the filtering"""
+    if not filters:
+        return query
+    
+    clauses = []
+    
+    publication_types = filters.get('publication_types') or []
+    if publication_types:
+        pt_terms = [f'"{PUBMED_PUBLICATION_TYPES.get(pt, pt)}"[pt]' for pt in publication_types]
+        clauses.append("(" + " OR ".join(pt_terms) + ")")
+    
+    year_range = filters.get('year_range')
+    if year_range:
+        start_year, end_year = year_range
+        clauses.append(f'("{start_year}"[dp] : "{end_year}"[dp])')
+    
+    language = filters.get('language')
+    if language:
+        clauses.append(f"{language}[lang]")
+    
+    if filters.get('has_abstract'):
+        clauses.append("hasabstract")
+    
+    if not clauses:
+        return query
+    return f"({query}) AND " + " AND ".join(clauses)
+
+def query_term_set(query: str) -> set:
+    """Lower-cased query words longer than two characters, for local relevance scoring"""
+    return {term for term in re.findall(r"[a-z0-9]+", query.lower()) if len(term) > 2}
+
+def prescreen_pubmed_ids(id_list: list, query: str, keep: int, api_key: str = None) -> list:
+    """Rank candidate PMIDs with a lightweight esummary call and keep the best ones"""
+    if len(id_list) <= keep:
+        return id_list
+    
+    summary_params = {
+        'db': 'pubmed',
+        'id': ','.join(id_list),
+        'retmode': 'json',
+        'api_key': st.session_state.pubmed_api_key if api_key is None else api_key
+    }
+    
+    summary_url = f"{PUBMED_API_URL}esummary.fcgi"
+    summary_response = requests.post(summary_url, data=summary_params, timeout=15)
+    summary_response.raise_for_status()
+    summaries = summary_response.json().get('result', {})
+    
+    query_terms = query_term_set(query)
+    
+    def score(position_and_id):
+        position, pmid = position_and_id
+        doc = summaries.get(pmid, {})
+        title_terms = set(re.findall(r"[a-z0-9]+", doc.get('title', '').lower()))
+        pubtypes = {pt.lower() for pt in doc.get('pubtype', [])}
+        has_abstract = "Has Abstract" in doc.get('attributes', [])
+        
+        value = len(query_terms & title_terms)
+        value += 2 * len(pubtypes & PRESCREEN_PREFERRED_PUBTYPES)
+        value += 1 if has_abstract else -3
+        # Earlier esearch hits win ties, preserving NCBI's relevance order
+        return (-value, position)
+    
+    ranked = sorted(enumerate(id_list), key=score)
+    return [pmid for _, pmid in ranked[:keep]]
+
+def parse_pubmed_xml(content: bytes) -> ArticleBatch:
+    """Parse an efetch XML payload into an ArticleBatch"""
+    root = ET.fromstring(content)
+    results = ArticleBatch()
+    
+    for article in root.findall('.//PubmedArticle'):
+        pmid = article.find('.//PMID').text if article.find('.//PMID') is not None else ""
+        title = article.find('.//ArticleTitle').text if article.find('.//ArticleTitle') is not None else "No title available"
+        journal = article.find('.//Journal/Title').text if article.find('.//Journal/Title') is not None else ""
+        year = article.find('.//JournalIssue/PubDate/Year').text if article.find('.//JournalIssue/PubDate/Year') is not None else ""
+        
+        abstract_parts = []
+        abstract_texts = article.findall('.//AbstractText')
+        for abstract_text in abstract_texts:
+            if abstract_text.text:
+                abstract_parts.append(abstract_text.text)
+        
+        abstract = " ".join(abstract_parts) if abstract_parts else "No abstract available"
+        
+        results.append(Article(
+            pmid=parse_pmid(pmid),
+            title=title,
+            snippet=abstract,
+            journal=journal or "",
+            year=int(year) if year and year.isdigit() else 0
+        ))
+    
+    return results
+
+def fetch_pubmed_articles(id_list: list, api_key: str = None) -> ArticleBatch:
+    """Fetch full records for a list of PMIDs with a single efetch call"""
+    fetch_params = {
+        'db': 'pubmed',
+        'id': ','.join(str(pmid) for pmid in id_list),
+        'retmode': 'xml',
+        'api_key': st.session_state.pubmed_api_key if api_key is None else api_key
+    }
+    
+    # POST keeps long ID lists out of the URL
+    fetch_url = f"{PUBMED_API_URL}efetch.fcgi"
+    fetch_response = requests.post(fetch_url, data=fetch_params, timeout=30)
+    fetch_response.raise_for_status()
+    
+    return parse_pubmed_xml(fetch_response.content)
+
+def run_pubmed_search(query: str, num_results: int, filters: dict, prescreen_factor: int, api_key: str) -> tuple:
+    """Run esearch, pre-screen and efetch without touching the page; returns (results, notices)"""
+    results = ArticleBatch()
+    notices = []
     try:
-        # Step 1: Search for PMIDs
+        # Step 1: Search for PMIDs, with filters pushed into the query term
+        candidate_count = num_results * prescreen_factor if prescreen_factor > 1 else num_results
         search_params = {
             'db': 'pubmed',
-            'term': query,
-            'retmax': num_results,
+            'term': build_pubmed_term(query, filters),
+            'retmax': candidate_count,
             'retmode': 'json',
-            'api_key': st.session_state.pubmed_api_key
+            'api_key': api_key
         }
         
         search_url = f"{PUBMED_API_URL}esearch.fcgi"
@@ -99,53 +433,306 @@ def search_pubmed_api(query: str, num_results=10) -> list:
         id_list = search_data.get('esearchresult', {}).get('idlist', [])
         
         if not id_list:
-            st.warning("No PubMed IDs found for your query")
-            return results
-        
-        # Step 2: Fetch article details
-        fetch_params = {
-            'db': 'pubmed',
-            'id': ','.join(id_list),
-            'retmode': 'xml',
-            'api_key': st.session_state.pubmed_api_key
-        }
+            notices.append(("warning", "No PubMed IDs found for your query"))
+            return results, notices
         
-        fetch_url = f"{PUBMED_API_URL}efetch.fcgi"
-        fetch_response = requests.get(fetch_url, params=fetch_params, timeout=30)
-        fetch_response.raise_for_status()
+        # Step 2: Pre-screen candidates via esummary so only the best get a full efetch
+        try:
+            id_list = prescreen_pubmed_ids(id_list, query, num_results, api_key)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            notices.append(("warning", f"PubMed pre-screen failed, using top search hits: {str(e)}"))
+            id_list = id_list[:num_results]
         
-        # Parse XML response
-        root = ET.fromstring(fetch_response.content)
+        # Step 3: Fetch article details
+        results = fetch_pubmed_articles(id_list, api_key)
         
-        for article in root.findall('.//PubmedArticle'):
-            pmid = article.find('.//PMID').text if article.find('.//PMID') is not None else ""
-            title = article.find('.//ArticleTitle').text if article.find('.//ArticleTitle') is not None else "No title available"
+    except requests.exceptions.RequestException as e:
+        notices.append(("error", f"PubMed API request failed: {str(e)}"))
+    except Exception as e:
+        notices.append(("error", f"Error processing PubMed results: {str(e)}"))
+    
+    return results, notices
+
+def show_pubmed_notices(notices: list):
+    """Display warnings and errors collected by run_pubmed_search"""
+    for level, message in notices:
+        if level == "error":
+            st.error(message)
+        else:
+            st.warning(message)
+
+def search_pubmed_api(query: str, num_results=10, filters: dict = None, prescreen_factor=3) -> ArticleBatch:
+    """Search PubMed using the NCBI E-utilities API"""
+    results, notices = run_pubmed_search(query, num_results, filters, prescreen_factor,
+                                         st.session_state.pubmed_api_key)
+    show_pubmed_notices(notices)
+    return results
+
+# NCBI allows 10 E-utilities requests per second with an API key, 3 without
+PUBMED_RATE_LIMIT_WITH_KEY = 10
+PUBMED_RATE_LIMIT_WITHOUT_KEY = 3
+BULK_BATCH_SIZE = 500
+# The history server only serves the first 10,000 records of a search
+PUBMED_HISTORY_MAX_RECORDS = 10000
+BULK_MAX_WORKERS = 3
+
+class RateLimiter:
+    """Thread-safe limiter that spaces requests at least 1/rate seconds apart"""
+    
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+    
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def fetch_history_batch(web_env: str, query_key: str, retstart: int, retmax: int,
+                        api_key: str, limiter: RateLimiter) -> ArticleBatch:
+    """Fetch one retstart/retmax page of a stored esearch result from the history server"""
+    fetch_params = {
+        'db': 'pubmed',
+        'query_key': query_key,
+        'WebEnv': web_env,
+        'retstart': retstart,
+        'retmax': retmax,
+        'retmode': 'xml',
+        'api_key': api_key
+    }
+    
+    limiter.wait()
+    fetch_response = requests.get(f"{PUBMED_API_URL}efetch.fcgi", params=fetch_params, timeout=60)
+    fetch_response.raise_for_status()
+    return parse_pubmed_xml(fetch_response.content)
+
+# Every bulk-harvested record is appended here, page by page, as it arrives
+HARVEST_STORE_PATH = "pubmed_harvest.csv"
+HARVEST_COLUMNS = ["Iteration", "Query", "PMID", "Title", "Journal", "Year", "Abstract"]
+
+def append_harvest_rows(batch: ArticleBatch, iteration: int, query: str, store_path: str, lock: threading.Lock):
+    """Append one harvested page to the harvest store CSV"""
+    if not len(batch):
+        return
+    rows = pd.DataFrame({
+        "Iteration": [iteration] * len(batch),
+        "Query": [query] * len(batch),
+        "PMID": list(batch.pmids),
+        "Title": batch.titles,
+        "Journal": batch.journals,
+        "Year": list(batch.years),
+        "Abstract": batch.snippets
+    }, columns=HARVEST_COLUMNS)
+    with lock:
+        rows.to_csv(store_path, mode='a', header=not os.path.exists(store_path), index=False)
+
+class BulkHarvester:
+    """Bulk history-server harvests whose pages stream into the harvest store in the background"""
+    
+    def __init__(self, max_records: int, api_key: str, store_path: str = HARVEST_STORE_PATH):
+        self.max_records = min(max_records, PUBMED_HISTORY_MAX_RECORDS)
+        # Streamlit session state is not available inside worker threads, so keep the key here
+        self.api_key = api_key
+        self.store_path = store_path
+        self.limiter = RateLimiter(PUBMED_RATE_LIMIT_WITH_KEY if api_key else PUBMED_RATE_LIMIT_WITHOUT_KEY)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=BULK_MAX_WORKERS)
+        self.futures = []
+        if os.path.exists(store_path):
+            os.remove(store_path)
+    
+    def store_page(self, web_env: str, query_key: str, retstart: int, retmax: int,
+                   iteration: int, query: str) -> tuple:
+        """Fetch and store one page off the main thread; returns (retstart, records stored, error)"""
+        try:
+            batch = fetch_history_batch(web_env, query_key, retstart, retmax, self.api_key, self.limiter)
+            append_harvest_rows(batch, iteration, query, self.store_path, self.lock)
+            return retstart, len(batch), ""
+        except (requests.exceptions.RequestException, ET.ParseError, OSError) as e:
+            return retstart, 0, str(e)
+    
+    def search(self, query: str, filters: dict = None, iteration: int = 0) -> ArticleBatch:
+        """Return the first page right away and keep harvesting the rest in the background"""
+        try:
+            # Step 1: Run the search once and park the PMID list on the history server
+            search_params = {
+                'db': 'pubmed',
+                'term': build_pubmed_term(query, filters),
+                'usehistory': 'y',
+                'sort': 'relevance',
+                'retmax': 0,
+                'retmode': 'json',
+                'api_key': self.api_key
+            }
             
-            abstract_parts = []
-            abstract_texts = article.findall('.//AbstractText')
-            for abstract_text in abstract_texts:
-                if abstract_text.text:
-                    abstract_parts.append(abstract_text.text)
+            self.limiter.wait()
+            search_response = requests.get(f"{PUBMED_API_URL}esearch.fcgi", params=search_params, timeout=15)
+            search_response.raise_for_status()
             
-            abstract = " ".join(abstract_parts) if abstract_parts else "No abstract available"
+            search_data = search_response.json().get('esearchresult', {})
+            web_env = search_data.get('webenv')
+            query_key = search_data.get('querykey')
+            total = min(int(search_data.get('count', 0)), self.max_records)
             
-            results.append({
-                'title': title,
-                'snippet': abstract,
-                'link': f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
-                'pmid': f"PMID: {pmid}"
-            })
+            if not web_env or not query_key or total == 0:
+                st.warning("No PubMed IDs found for your query")
+                return ArticleBatch()
+            
+            # Step 2: The best-match page goes straight on to the rest of the pipeline
+            first_page = fetch_history_batch(web_env, query_key, 0, min(BULK_BATCH_SIZE, total),
+                                             self.api_key, self.limiter)
+            append_harvest_rows(first_page, iteration, query, self.store_path, self.lock)
+        except requests.exceptions.RequestException as e:
+            st.error(f"PubMed bulk harvest failed: {str(e)}")
+            return ArticleBatch()
+        except Exception as e:
+            st.error(f"Error processing PubMed bulk results: {str(e)}")
+            return ArticleBatch()
+        
+        # Step 3: Later pages download concurrently, within the rate limit, while the LLM works
+        for retstart in range(BULK_BATCH_SIZE, total, BULK_BATCH_SIZE):
+            self.futures.append(self.executor.submit(
+                self.store_page, web_env, query_key, retstart,
+                min(BULK_BATCH_SIZE, total - retstart), iteration, query
+            ))
+        return first_page
+    
+    def pending(self) -> int:
+        return sum(1 for future in self.futures if not future.done())
+    
+    def finish(self) -> tuple:
+        """Wait for outstanding pages; returns (records in the store, [(retstart, error), ...])"""
+        failures = []
+        for future in self.futures:
+            retstart, _, error = future.result()
+            if error:
+                failures.append((retstart, error))
+        self.executor.shutdown()
+        
+        stored = 0
+        if os.path.exists(self.store_path):
+            for chunk in pd.read_csv(self.store_path, usecols=["PMID"], chunksize=EXPORT_CHUNK_ROWS):
+                stored += len(chunk)
+        return stored, failures
+
+# ELink related-article expansion settings
+ELINK_BATCH_SIZE = 100
+ELINK_NEIGHBORS_PER_ARTICLE = 50
+EXPANSION_MODE_LLM = "LLM query refinement"
+EXPANSION_MODE_ELINK = "ELink related articles"
+
+def fetch_related_pmids(pmids: list) -> dict:
+    """Return {pmid: (related pmids, best first)} using batched, cached ELink calls"""
+    cache = st.session_state.elink_cache
+    missing = [pmid for pmid in pmids if pmid and pmid not in cache]
+    
+    for i in range(0, len(missing), ELINK_BATCH_SIZE):
+        batch = missing[i:i + ELINK_BATCH_SIZE]
+        # One id= parameter per PMID gives a separate linkset for each source article
+        link_params = {
+            'dbfrom': 'pubmed',
+            'db': 'pubmed',
+            'linkname': 'pubmed_pubmed',
+            'cmd': 'neighbor_score',
+            'id': [str(pmid) for pmid in batch],
+            'retmode': 'json',
+            'api_key': st.session_state.pubmed_api_key
+        }
         
+        link_url = f"{PUBMED_API_URL}elink.fcgi"
+        link_response = requests.post(link_url, data=link_params, timeout=30)
+        link_response.raise_for_status()
+        
+        for linkset in link_response.json().get('linksets', []):
+            source = parse_pmid((linkset.get('ids') or [""])[0])
+            related = []
+            for linksetdb in linkset.get('linksetdbs', []):
+                if linksetdb.get('linkname') != 'pubmed_pubmed':
+                    continue
+                for link in linksetdb.get('links', []):
+                    related.append(parse_pmid(link.get('id') if isinstance(link, dict) else link))
+            cache[source] = tuple(pmid for pmid in related if pmid and pmid != source)[:ELINK_NEIGHBORS_PER_ARTICLE]
+        
+        # Remember articles with no neighbors too, so they are not requested again
+        for pmid in batch:
+            cache.setdefault(pmid, ())
+    
+    return {pmid: cache.get(pmid, ()) for pmid in pmids if pmid}
+
+def rank_related_candidates(related: dict, seen: set, limit: int) -> list:
+    """Score unseen related PMIDs locally by how many current articles point to them"""
+    votes = Counter()
+    best_rank = {}
+    for neighbors in related.values():
+        for rank, pmid in enumerate(neighbors):
+            if pmid in seen:
+                continue
+            votes[pmid] += 1
+            best_rank[pmid] = min(rank, best_rank.get(pmid, rank))
+    
+    ranked = sorted(votes, key=lambda pmid: (-votes[pmid], best_rank[pmid]))
+    return ranked[:limit]
+
+def related_neighborhood(related: dict) -> set:
+    """The article cluster: source PMIDs plus everything they link to"""
+    neighborhood = set(related)
+    for neighbors in related.values():
+        neighborhood.update(neighbors)
+    return neighborhood
+
+def cluster_novelty(neighborhood: set, analyzed: set) -> float:
+    """Fraction of a cluster that has not already been sent to the LLM"""
+    if not neighborhood:
+        return 0.0
+    return len(neighborhood - analyzed) / len(neighborhood)
+
+def filter_pubmed_ids(id_list: list, filters: dict = None) -> list:
+    """Keep only the PMIDs that match the sidebar filters, preserving their order"""
+    uid_clause = "(" + " OR ".join(f"{pmid}[uid]" for pmid in id_list) + ")"
+    term = build_pubmed_term(uid_clause, filters)
+    if not id_list or term == uid_clause:
+        return id_list
+    
+    search_params = {
+        'db': 'pubmed',
+        'term': term,
+        'retmax': len(id_list),
+        'retmode': 'json',
+        'api_key': st.session_state.pubmed_api_key
+    }
+    
+    # POST keeps long ID lists out of the URL
+    search_url = f"{PUBMED_API_URL}esearch.fcgi"
+    search_response = requests.post(search_url, data=search_params, timeout=15)
+    search_response.raise_for_status()
+    
+    matching = {parse_pmid(pmid) for pmid in search_response.json().get('esearchresult', {}).get('idlist', [])}
+    return [pmid for pmid in id_list if pmid in matching]
+
+def expand_with_elink(frontier: list, seen: set, num_results=10, filters: dict = None,
+                      candidate_factor=3) -> ArticleBatch:
+    """Grow the corpus with the best-connected unseen related articles of the frontier"""
+    try:
+        related = fetch_related_pmids(frontier)
+        # Rank a wider pool so enough candidates survive the sidebar filters
+        candidates = rank_related_candidates(related, seen, num_results * candidate_factor)
+        candidates = filter_pubmed_ids(candidates, filters)[:num_results]
+        if not candidates:
+            return ArticleBatch()
+        return fetch_pubmed_articles(candidates)
     except requests.exceptions.RequestException as e:
-        st.error(f"PubMed API request failed: {str(e)}")
+        st.error(f"PubMed ELink request failed: {str(e)}")
     except Exception as e:
-        st.error(f"Error processing PubMed results: {str(e)}")
-    
-    return results
+        st.error(f"Error processing PubMed related articles: {str(e)}")
+    return ArticleBatch()
 
-def web_search_fallback(query: str, num_results=10) -> list:
+def web_search_fallback(query: str, num_results=10) -> ArticleBatch:
     """Fallback method using direct PubMed web scraping"""
-    results = []
+    results = ArticleBatch()
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
@@ -168,59 +755,122 @@ def web_search_fallback(query: str, num_results=10) -> list:
                 snippet_element = article.find('div', class_='docsum-snippet')
                 pmid_element = article.find('span', class_='docsum-pmid')
                 
-                pmid = pmid_element.get_text().strip() if pmid_element else ""
-                pmid_url = f"https://pubmed.ncbi.nlm.nih.gov{title_element.get('href')}" if title_element and title_element.get('href') else ""
+                pmid = parse_pmid(pmid_element.get_text()) if pmid_element else 0
+                if not pmid and title_element and title_element.get('href'):
+                    # Docsum links look like /12345678/, so the PMID can be read from the href
+                    href_match = re.match(r"/?(\d+)/?", title_element.get('href'))
+                    pmid = int(href_match.group(1)) if href_match else 0
+                if not pmid:
+                    # Without a PMID there is no valid PubMed link to show
+                    continue
                 
-                results.append({
-                    'title': title_element.get_text().strip() if title_element else "No title available",
-                    'snippet': snippet_element.get_text().strip() if snippet_element else "No abstract available",
-                    'link': pmid_url,
-                    'pmid': pmid
-                })
+                results.append(Article(
+                    pmid=pmid,
+                    title=title_element.get_text().strip() if title_element else "No title available",
+                    snippet=snippet_element.get_text().strip() if snippet_element else "No abstract available"
+                ))
     except Exception as e:
         st.warning(f"PubMed fallback search failed: {str(e)}")
     
     return results
 
-def web_search(query: str, num_results=10) -> list:
+def web_search(query: str, num_results=10, filters: dict = None, prescreen_factor=3,
+               harvester: BulkHarvester = None, iteration=0) -> ArticleBatch:
     """Perform search using PubMed API with fallback methods"""
     # First, try using the PubMed API
-    st.info("🔍 Searching PubMed via official API...")
-    results = search_pubmed_api(query, num_results)
+    if harvester:
+        st.info("📦 Bulk harvesting PubMed via the E-utilities history server...")
+        results = harvester.search(query, filters, iteration)
+    else:
+        st.info("🔍 Searching PubMed via official API...")
+        results = search_pubmed_api(query, num_results, filters, prescreen_factor)
     
     # If API fails, use web scraping fallback
     if not results:
         st.warning("PubMed API failed. Using direct web scraping as fallback...")
-        results = web_search_fallback(query, num_results)
+        results = web_search_fallback(build_pubmed_term(query, filters), num_results)
     
     # If both methods fail, use sample data
     if not results:
         st.error("⚠️ Both PubMed search methods failed. Using sample data for demonstration.")
-        return [
-            {
-                'title': f'Research on "{query}" - PubMed Example 1',
-                'snippet': f'Abstract: Our study investigated key variables in this domain. Results showed significant correlations...',
-                'link': 'https://pubmed.ncbi.nlm.nih.gov/12345678/',
-                'pmid': 'PMID: 12345678'
-            },
-            {
-                'title': f'Meta-analysis of "{query}" - PubMed Example 2',
-                'snippet': f'Abstract: This systematic review examined existing literature on the topic. Meta-analysis revealed heterogeneity...',
-                'link': 'https://pubmed.ncbi.nlm.nih.gov/87654321/',
-                'pmid': 'PMID: 87654321'
-            }
-        ]
+        return ArticleBatch([
+            Article(
+                pmid=12345678,
+                title=f'Research on "{query}" - PubMed Example 1',
+                snippet=f'Abstract: Our study investigated key variables in this domain. Results showed significant correlations...'
+            ),
+            Article(
+                pmid=87654321,
+                title=f'Meta-analysis of "{query}" - PubMed Example 2',
+                snippet=f'Abstract: This systematic review examined existing literature on the topic. Meta-analysis revealed heterogeneity...'
+            )
+        ])
     
     return results
 
-def summarize_search_results(search_results: list) -> str:
-    """Summarize PubMed search results using DeepSeek"""
+# Base prompt for gap analysis - PubMed focused
+GAP_ANALYSIS_PROMPT = (
+    "You are a PubMed meta-analysis strategist. Based ONLY on the summarized PubMed findings:\n"
+    "{summary}\n\n"
+    "Analyze these PubMed research findings to:\n"
+    "1. Identify key knowledge gaps, unresolved questions, or contradictions (STRICTLY from PubMed sources only)\n"
+    "2. If no significant gap is found, propose a refined PubMed search query\n"
+    "3. If a gap exists, describe it clearly and suggest a compelling PubMed-based meta-analysis title\n"
+    "4. Always provide a refined PubMed search query for the next iteration\n\n"
+    "Structure your response with these labels:\n"
+    "- Gap: [description of PubMed gap or No significant gap in PubMed]\n"
+    "- Meta-analysis Title: [proposed title if gap found, otherwise N/A]\n"
+    "- Refined PubMed Query: [suggested query for next PubMed search iteration]\n\n"
+    "CRITICAL: Base your analysis ONLY on the provided PubMed sources. Do NOT use external knowledge or sources."
+)
+
+# Single-call prompt that returns the summary and the gap analysis together
+FUSED_ANALYSIS_PROMPT = (
+    "You are a PubMed meta-analysis strategist. Based ONLY on the following PubMed research:\n\n"
+    "{results}\n\n"
+    "In a single response:\n"
+    "1. Summarize the main themes, methodologies, key findings, and any contradictions or inconsistencies (3-4 paragraphs, STRICTLY from these PubMed sources)\n"
+    "2. Identify key knowledge gaps, unresolved questions, or contradictions (STRICTLY from PubMed sources only)\n"
+    "3. If a gap exists, describe it clearly and suggest a compelling PubMed-based meta-analysis title\n"
+    "4. Always provide a refined PubMed search query for the next iteration\n\n"
+    "Structure your response with these labels, in this order:\n"
+    "- Summary: [3-4 paragraph summary of the PubMed research]\n"
+    "- Gap: [description of PubMed gap or No significant gap in PubMed]\n"
+    "- Meta-analysis Title: [proposed title if gap found, otherwise N/A]\n"
+    "- Refined PubMed Query: [suggested query for next PubMed search iteration]\n\n"
+    "CRITICAL: Base your analysis ONLY on the provided PubMed sources. Do NOT use external knowledge or sources."
+)
+
+# Rolling summary prompt: fold only unseen PubMed results into the previous summary
+ROLLING_SUMMARY_PROMPT = (
+    "Here is the running summary of PubMed research for a meta-analysis:\n\n"
+    "{previous_summary}\n\n"
+    "The following PubMed results have not been covered by that summary yet:\n\n"
+    "{results}\n\n"
+    "Please update the summary so it also reflects these new PubMed results:\n"
+    "1. Keep the main themes, methodologies and findings that are still relevant\n"
+    "2. Add new themes, key findings and conclusions (STRICTLY from these PubMed sources)\n"
+    "3. Note any contradictions or inconsistencies between new and earlier findings\n"
+    "4. Keep it concise but comprehensive (3-4 paragraphs)\n"
+    "5. Do NOT use any external knowledge or sources"
+)
+
+LLM_MODE_TWO_CALL = "Two calls (summarize, then analyze)"
+LLM_MODE_FUSED = "Single fused call"
+
+def format_search_results(search_results: ArticleBatch) -> str:
+    """Render PubMed results as the text block shown to the LLM"""
     text_content = ""
-    for i, result in enumerate(search_results[:10], 1):
+    for i, result in enumerate(search_results, 1):
         text_content += f"PubMed Result {i}:\n"
-        text_content += f"Title: {result['title']}\n"
-        text_content += f"PMID: {result['pmid']}\n"
-        text_content += f"Abstract: {result['snippet']}\n\n"
+        text_content += f"Title: {result.title}\n"
+        text_content += f"{result.pmid_label}\n"
+        text_content += f"Abstract: {result.snippet}\n\n"
+    return text_content
+
+def summarize_search_results(search_results: ArticleBatch, respond=get_deepseek_response) -> str:
+    """Summarize PubMed search results using DeepSeek"""
+    text_content = format_search_results(search_results)
     
     prompt = f"""Please provide a comprehensive summary of the following PubMed research for meta-analysis:
 
@@ -233,12 +883,49 @@ Your summary should:
 4. Keep it concise but comprehensive (3-4 paragraphs)
 5. Do NOT use any external knowledge or sources"""
 
-    return get_deepseek_response(prompt)
+    return respond(prompt)
+
+def summarize_new_results(search_results: ArticleBatch, previous_summary: str, summarized_pmids: set,
+                          respond=get_deepseek_response) -> str:
+    """Update the rolling summary with only the PubMed results it has not seen yet"""
+    if not previous_summary:
+        return summarize_search_results(search_results, respond)
+    
+    # Records without a PMID cannot be matched, so treat them as new
+    new_results = ArticleBatch(result for result in search_results
+                               if not result.pmid or result.pmid not in summarized_pmids)
+    if not new_results:
+        return previous_summary
+    
+    prompt = ROLLING_SUMMARY_PROMPT.format(
+        previous_summary=previous_summary,
+        results=format_search_results(new_results)
+    )
+    return respond(prompt)
 
-def analyze_knowledge_gaps(summary: str, base_prompt: str) -> str:
+def analyze_knowledge_gaps(summary: str, base_prompt: str, respond=get_deepseek_response) -> str:
     """Analyze PubMed summary for knowledge gaps using DeepSeek"""
     full_prompt = base_prompt.format(summary=summary)
-    return get_deepseek_response(full_prompt)
+    return respond(full_prompt)
+
+def split_fused_response(response_text: str) -> tuple:
+    """Split a fused completion into (summary, gap analysis) at the Gap label"""
+    match = re.search(r"^[\s\-*#]*gap\s*\**\s*:", response_text, re.IGNORECASE | re.MULTILINE)
+    if not match:
+        return response_text, response_text
+    
+    summary = response_text[:match.start()].strip()
+    summary = re.sub(r"^[\s\-*#]*summary\s*\**\s*:\s*\**\s*", "", summary, flags=re.IGNORECASE)
+    return summary, response_text[match.start():].strip()
+
+def summarize_and_analyze(search_results: ArticleBatch, fused_prompt: str = FUSED_ANALYSIS_PROMPT,
+                          respond=get_deepseek_response) -> tuple:
+    """Summarize PubMed results and analyze them for gaps in one DeepSeek call"""
+    full_prompt = fused_prompt.format(results=format_search_results(search_results))
+    response_text = respond(full_prompt, max_tokens=FUSED_MAX_TOKENS)
+    if not response_text:
+        return "", ""
+    return split_fused_response(response_text)
 
 def extract_gap_info(response_text: str, current_query: str) -> tuple:
     """Extract structured gap information from DeepSeek response"""
@@ -278,6 +965,12 @@ def extract_gap_info(response_text: str, current_query: str) -> tuple:
                 gap_text = match.group(1).strip()
                 break
     
+    # Same line parser the streaming path uses, so both modes pick the same next query
+    for line in response_text.split("\n"):
+        next_query = parse_refined_query_line(line)
+        if next_query:
+            break
+    
     query_patterns = [
         r"refined\s*query\s*[:\-]?\s*(.+)",
         r"next\s*query\s*[:\-]?\s*(.+)",
@@ -285,10 +978,11 @@ def extract_gap_info(response_text: str, current_query: str) -> tuple:
         r"suggested\s*query\s*[:\-]?\s*(.+)"
     ]
     for pattern in query_patterns:
+        if next_query:
+            break
         match = re.search(pattern, response_text, re.IGNORECASE | re.DOTALL)
         if match:
             next_query = match.group(1).strip()
-            break
     
     if gap_found and not gap_text:
         gap_text = "Knowledge gap identified in PubMed sources but not clearly described."
@@ -313,6 +1007,57 @@ def save_data_to_csv(row_data: dict, csv_path: str, table_placeholder) -> pd.Dat
     table_placeholder.dataframe(df)
     return df
 
+# Rows read from the results store per chunk when building an export
+EXPORT_CHUNK_ROWS = 500
+
+def iter_results_chunks(csv_path: str, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Stream the results store in chunks so exports never hold the full table at once"""
+    yield from pd.read_csv(csv_path, dtype=str, chunksize=chunk_rows)
+
+def export_results_csv(csv_path: str) -> bytes:
+    """The results store is already a CSV, so serve it as-is"""
+    with open(csv_path, 'rb') as f:
+        return f.read()
+
+def export_results_json(csv_path: str) -> bytes:
+    """Build an indented JSON array of records, one chunk at a time"""
+    buffer = io.StringIO()
+    buffer.write("[")
+    first = True
+    for chunk in iter_results_chunks(csv_path):
+        records = chunk.to_json(orient='records', indent=2).strip()[1:-1].strip()
+        if not records:
+            continue
+        buffer.write("\n  " if first else ",\n  ")
+        buffer.write(records)
+        first = False
+    buffer.write("\n]")
+    return buffer.getvalue().encode('utf-8')
+
+def export_results_jsonl_gz(csv_path: str) -> bytes:
+    """Gzip-compressed JSON Lines, one record per line"""
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as gz:
+        for chunk in iter_results_chunks(csv_path):
+            lines = chunk.to_json(orient='records', lines=True)
+            if lines and not lines.endswith("\n"):
+                lines += "\n"
+            gz.write(lines.encode('utf-8'))
+    return buffer.getvalue()
+
+def export_results_parquet(csv_path: str) -> bytes:
+    """Columnar Parquet file, written one row group per chunk"""
+    buffer = io.BytesIO()
+    writer = None
+    for chunk in iter_results_chunks(csv_path):
+        if writer is None:
+            schema = pa.schema([(column, pa.string()) for column in chunk.columns])
+            writer = pq.ParquetWriter(buffer, schema, compression='snappy')
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    if writer is not None:
+        writer.close()
+    return buffer.getvalue()
+
 def display_flashy_titles(topics: list):
     """Display meta-analysis titles in a flashy format at the top of the page"""
     if not topics:
@@ -607,6 +1352,114 @@ def main():
             help="Maximum number of PubMed search iterations"
         )
         
+        num_results = st.number_input(
+            "📄 Results per Iteration",
+            min_value=5,
+            max_value=50,
+            value=10,
+            step=5,
+            help="Number of PubMed articles shown and summarized per iteration"
+        )
+        
+        bulk_mode = st.checkbox(
+            "📦 Bulk Harvest Mode",
+            value=False,
+            help="Scan thousands of records per query via the E-utilities history server"
+        )
+        bulk_max_records = 0
+        if bulk_mode:
+            bulk_max_records = st.number_input(
+                "Max Records per Query",
+                min_value=BULK_BATCH_SIZE,
+                max_value=PUBMED_HISTORY_MAX_RECORDS,
+                value=2000,
+                step=BULK_BATCH_SIZE,
+                help=(f"Each iteration downloads the full harvest (full PubMed records, in batches of {BULK_BATCH_SIZE}) "
+                      f"into {HARVEST_STORE_PATH}. The first batch feeds the summary right away; the rest streams in "
+                      f"the background. PubMed serves at most {PUBMED_HISTORY_MAX_RECORDS:,} records per search.")
+            )
+        
+        expansion_mode = st.radio(
+            "🧭 Expansion Mode",
+            options=[EXPANSION_MODE_LLM, EXPANSION_MODE_ELINK],
+            index=0,
+            help="Grow the corpus from LLM-refined queries, or from PubMed related articles via ELink"
+        )
+        novelty_threshold = 0.5
+        if expansion_mode == EXPANSION_MODE_ELINK:
+            novelty_threshold = st.slider(
+                "New Cluster Threshold",
+                min_value=0.1,
+                max_value=1.0,
+                value=0.5,
+                step=0.05,
+                help="Only call the LLM when at least this fraction of the related-article cluster is new"
+            )
+        
+        llm_mode = st.radio(
+            "🤖 LLM Mode",
+            options=[LLM_MODE_TWO_CALL, LLM_MODE_FUSED],
+            index=0,
+            help="The fused mode returns the summary, gap, title and refined query in one completion, halving LLM round trips"
+        )
+        
+        rolling_summary_mode = False
+        if llm_mode == LLM_MODE_TWO_CALL:
+            rolling_summary_mode = st.checkbox(
+                "🔁 Rolling Summary",
+                value=False,
+                help="Only send abstracts with unseen PMIDs to the LLM, together with the previous summary"
+            )
+        
+        stream_llm = st.checkbox(
+            "⚡ Stream LLM Responses",
+            value=True,
+            help="Show responses as they are generated and start the next PubMed search as soon as the refined query is written"
+        )
+        
+        st.markdown("---")
+        st.subheader("🧪 PubMed Filters")
+        publication_types = st.multiselect(
+            "Publication Types",
+            options=list(PUBMED_PUBLICATION_TYPES.keys()),
+            default=[],
+            help="Only retrieve these publication types (leave empty for all)"
+        )
+        use_year_range = st.checkbox("Limit publication years", value=False)
+        year_range = None
+        if use_year_range:
+            year_range = st.slider(
+                "Publication Years",
+                min_value=1950,
+                max_value=2030,
+                value=(2010, 2025)
+            )
+        language_label = st.selectbox(
+            "Language",
+            options=list(PUBMED_LANGUAGES.keys()),
+            index=0
+        )
+        has_abstract = st.checkbox(
+            "Only articles with abstracts",
+            value=False,
+            help="Articles without abstracts give the summarizer nothing to work with"
+        )
+        prescreen_factor = st.number_input(
+            "📑 Pre-screen Pool Multiplier",
+            min_value=1,
+            max_value=10,
+            value=3,
+            step=1,
+            help="Rank this many times more candidates with a cheap esummary call before fetching full records (1 disables the pre-screen)"
+        )
+        
+        pubmed_filters = {
+            'publication_types': publication_types,
+            'year_range': year_range,
+            'language': PUBMED_LANGUAGES[language_label],
+            'has_abstract': has_abstract
+        }
+        
         st.markdown("---")
         st.subheader("📋 Instructions")
         st.info("""
@@ -666,6 +1519,8 @@ def main():
         if st.button("🔄 Reset", type="secondary", use_container_width=True):
             if os.path.exists("knowledge_gaps.csv"):
                 os.remove("knowledge_gaps.csv")
+            if os.path.exists(HARVEST_STORE_PATH):
+                os.remove(HARVEST_STORE_PATH)
             st.rerun()
     
     if start_button and not st.session_state.experiment_running:
@@ -683,24 +1538,22 @@ def main():
         table_placeholder = st.empty()
         
         # Base prompt for gap analysis - PubMed focused
-        base_prompt = (
-            "You are a PubMed meta-analysis strategist. Based ONLY on the summarized PubMed findings:\n"
-            "{summary}\n\n"
-            "Analyze these PubMed research findings to:\n"
-            "1. Identify key knowledge gaps, unresolved questions, or contradictions (STRICTLY from PubMed sources only)\n"
-            "2. If no significant gap is found, propose a refined PubMed search query\n"
-            "3. If a gap exists, describe it clearly and suggest a compelling PubMed-based meta-analysis title\n"
-            "4. Always provide a refined PubMed search query for the next iteration\n\n"
-            "Structure your response with these labels:\n"
-            "- Gap: [description of PubMed gap or No significant gap in PubMed]\n"
-            "- Meta-analysis Title: [proposed title if gap found, otherwise N/A]\n"
-            "- Refined PubMed Query: [suggested query for next PubMed search iteration]\n\n"
-            "CRITICAL: Base your analysis ONLY on the provided PubMed sources. Do NOT use external knowledge or sources."
-        )
+        base_prompt = GAP_ANALYSIS_PROMPT
         
         current_query = topic
         csv_path = "knowledge_gaps.csv"
         gaps_found = []  # Track gaps found during iterations
+        use_elink = expansion_mode == EXPANSION_MODE_ELINK
+        seen_pmids = set()  # PMIDs already pulled into the corpus
+        frontier_pmids = []  # PMIDs to expand from in ELink mode
+        analyzed_neighborhood = set()  # Cluster already sent to the LLM
+        rolling_summary = ""  # Running summary in rolling summary mode
+        summarized_pmids = set()  # PMIDs already folded into the rolling summary
+        prefetch = None  # (query, Future) for a search launched while the LLM was still streaming
+        # Bulk and ELink modes drive their own retrieval, so only plain searches are prefetched
+        can_prefetch = stream_llm and not use_elink and not bulk_max_records
+        harvester = BulkHarvester(bulk_max_records, st.session_state.pubmed_api_key) if bulk_max_records else None
+        prefetch_executor = ThreadPoolExecutor(max_workers=1) if can_prefetch else None
         
         # Initialize empty table
         df = pd.DataFrame(columns=["Meta_Analysis_Topic", "Gap_Text", "Score", "Other_Output", "Gemini_Blob"])
@@ -722,9 +1575,27 @@ def main():
                 progress_bar.progress(progress, text=f"PubMed Search {iteration}/{max_iterations}")
                 status_text.markdown(f"### 🔍 Analyzing PubMed for: '{current_query}'")
                 
-                # Perform PubMed search
-                st.markdown(f"**🌐 Searching PubMed for '{current_query}'... (Iteration {iteration})**")
-                search_results = web_search(current_query, num_results=10)
+                # Expand via related articles, or perform a PubMed search
+                search_results = None
+                if use_elink and frontier_pmids:
+                    st.markdown(f"**🔗 Expanding PubMed related articles... (Iteration {iteration})**")
+                    search_results = expand_with_elink(frontier_pmids, seen_pmids, num_results, pubmed_filters)
+                    if not search_results:
+                        st.warning("No new related articles found. Falling back to a PubMed search.")
+                
+                if not search_results and prefetch and prefetch[0] == current_query:
+                    # The worker never writes to the page, so report its messages here.
+                    # An empty prefetch falls through to a normal search, which reports its own.
+                    search_results, notices = prefetch[1].result()
+                    if search_results:
+                        show_pubmed_notices(notices)
+                        st.markdown(f"**⚡ Using PubMed results for '{current_query}' fetched while the LLM was streaming... (Iteration {iteration})**")
+                prefetch = None
+                
+                if not search_results:
+                    st.markdown(f"**🌐 Searching PubMed for '{current_query}'... (Iteration {iteration})**")
+                    search_results = web_search(current_query, num_results=num_results, filters=pubmed_filters,
+                                                prescreen_factor=prescreen_factor, harvester=harvester, iteration=iteration)
                 
                 if not search_results:
                     st.error("❌ No PubMed results found. Ending analysis.")
@@ -733,25 +1604,99 @@ def main():
                 
                 # Display the search results directly
                 st.markdown(f"### 📚 PubMed Search Results - Iteration {iteration}")
-                for i, result in enumerate(search_results, 1):
-                    st.markdown(f"**{i}. {result['title']}**")
-                    st.markdown(f"- **{result['pmid']}**")
-                    st.markdown(f"- **Abstract:** {result['snippet']}")
-                    st.markdown(f"- [Link to PubMed article]({result['link']})")
+                if harvester:
+                    st.caption(f"Summarizing the top {num_results} best-match records; {harvester.pending()} more harvest "
+                               f"batches are streaming into {HARVEST_STORE_PATH} in the background")
+                for i, result in enumerate(search_results[:num_results], 1):
+                    st.markdown(f"**{i}. {result.title}**")
+                    st.markdown(f"- **{result.pmid_label}**")
+                    st.markdown(f"- **Abstract:** {result.snippet}")
+                    st.markdown(f"- [Link to PubMed article]({result.link})")
                     st.markdown("---")
                 
-                # Summarize PubMed results
-                st.markdown(f"### 📝 PubMed Summary - Iteration {iteration}")
-                summary = summarize_search_results(search_results)
-                st.info(summary)
+                seen_pmids.update(pmid for pmid in search_results.pmids if pmid)
+                frontier_pmids = [pmid for pmid in search_results.pmids[:num_results] if pmid]
+                
+                # In ELink mode, only spend LLM calls on a meaningfully new cluster
+                if use_elink:
+                    try:
+                        cluster = related_neighborhood(fetch_related_pmids(frontier_pmids))
+                    except requests.exceptions.RequestException as e:
+                        st.warning(f"PubMed ELink request failed: {str(e)}")
+                        cluster = set(frontier_pmids)
+                    novelty = cluster_novelty(cluster, analyzed_neighborhood)
+                    if analyzed_neighborhood and novelty < novelty_threshold:
+                        st.info(f"🔗 Only {novelty:.0%} of this article cluster is new. Skipping LLM analysis and expanding further.")
+                        st.markdown("---")
+                        continue
+                    analyzed_neighborhood |= cluster
                 
-                # Analyze for knowledge gaps in PubMed
-                st.markdown(f"### 🔬 PubMed Gap Analysis - Iteration {iteration}")
-                gap_analysis = analyze_knowledge_gaps(summary, base_prompt)
-                st.info(gap_analysis)
+                # Launch the next search as soon as the streamed refined query line is complete
+                watcher = None
+                if stream_llm:
+                    watcher = RefinedQueryWatcher(
+                        on_query=lambda query: prefetch_executor.submit(
+                            run_pubmed_search, query, num_results, pubmed_filters, prescreen_factor,
+                            st.session_state.pubmed_api_key
+                        ) if can_prefetch else None
+                    )
+                
+                if llm_mode == LLM_MODE_FUSED:
+                    # Summarize and analyze in a single round trip
+                    st.markdown(f"### 📝 PubMed Summary - Iteration {iteration}")
+                    summary_placeholder = st.empty()
+                    if stream_llm:
+                        summary, gap_analysis = summarize_and_analyze(
+                            search_results[:num_results],
+                            respond=lambda prompt, max_tokens: stream_to_placeholder(
+                                prompt, summary_placeholder, watcher, max_tokens=max_tokens
+                            )
+                        )
+                    else:
+                        summary, gap_analysis = summarize_and_analyze(search_results[:num_results])
+                    summary_placeholder.info(summary)
+                    st.markdown(f"### 🔬 PubMed Gap Analysis - Iteration {iteration}")
+                    st.info(gap_analysis)
+                else:
+                    # Summarize PubMed results
+                    st.markdown(f"### 📝 PubMed Summary - Iteration {iteration}")
+                    summary_placeholder = st.empty()
+                    summary_respond = get_deepseek_response
+                    if stream_llm:
+                        summary_respond = lambda prompt: stream_to_placeholder(prompt, summary_placeholder)
+                    
+                    top_results = search_results[:num_results]
+                    if rolling_summary_mode:
+                        new_count = sum(1 for pmid in top_results.pmids if not pmid or pmid not in summarized_pmids)
+                        if rolling_summary and not new_count:
+                            st.caption("♻️ No new PubMed abstracts, reusing the previous summary")
+                        elif rolling_summary:
+                            st.caption(f"🔁 Rolling summary: {new_count} of {len(top_results)} abstracts are new")
+                        summary = summarize_new_results(top_results, rolling_summary, summarized_pmids,
+                                                        respond=summary_respond)
+                    else:
+                        summary = summarize_search_results(top_results, respond=summary_respond)
+                    summary_placeholder.info(summary)
+                    
+                    if rolling_summary_mode and summary:
+                        rolling_summary = summary
+                        summarized_pmids.update(top_results.pmids)
+                    
+                    # Analyze for knowledge gaps in PubMed
+                    st.markdown(f"### 🔬 PubMed Gap Analysis - Iteration {iteration}")
+                    analysis_placeholder = st.empty()
+                    analysis_respond = get_deepseek_response
+                    if stream_llm:
+                        analysis_respond = lambda prompt: stream_to_placeholder(prompt, analysis_placeholder, watcher)
+                    gap_analysis = analyze_knowledge_gaps(summary, base_prompt, respond=analysis_respond)
+                    analysis_placeholder.info(gap_analysis)
                 
                 # Extract structured information
-                gap_found, meta_title, gap_text, next_query = extract_gap_info(gap_analysis, current_query)
+                gap_found, meta_title, gap_text, next_query = extract_gap_info(gap_analysis or "", current_query)
+                
+                # extract_gap_info parses the same line as the watcher, so the prefetched search matches
+                if watcher and watcher.result and watcher.query == next_query:
+                    prefetch = (next_query, watcher.result)
                 
                 # Track gaps found
                 if gap_found:
@@ -781,6 +1726,23 @@ def main():
             if iteration == max_iterations and not stop_button:
                 normal_completion = True
             
+            # Wait for the background bulk harvest and offer the full record set
+            if harvester:
+                with st.spinner(f"📦 Finishing {harvester.pending()} outstanding harvest batches..."):
+                    harvested_count, failed_pages = harvester.finish()
+                for retstart, error in failed_pages:
+                    st.warning(f"PubMed bulk page starting at record {retstart:,} failed and was skipped: {error}")
+                if harvested_count:
+                    st.info(f"📦 {harvested_count:,} harvested PubMed records saved to {HARVEST_STORE_PATH}")
+                    st.download_button(
+                        label="📦 Download Harvested Records (CSV)",
+                        data=lambda: export_results_csv(HARVEST_STORE_PATH),
+                        file_name=f"{topic.replace(' ', '_')}_pubmed_harvest.csv",
+                        mime="text/csv",
+                        type="secondary",
+                        on_click="ignore"
+                    )
+            
             # Final results
             if not df.empty and not st.session_state.experiment_running:
                 st.subheader("📊 PubMed Analysis Results")
@@ -807,35 +1769,62 @@ def main():
                 st.markdown("---")
                 st.markdown("### 📥 Download Your Results")
                 
-                # Create two download options side by side
-                dl_col1, dl_col2 = st.columns(2)
+                # Exports are generated only when a button is clicked, streamed from the results store
+                file_stem = f"{topic.replace(' ', '_')}_pubmed_gaps"
+                dl_col1, dl_col2, dl_col3, dl_col4 = st.columns(4)
                 
-                csv = df.to_csv(index=False).encode('utf-8')
                 with dl_col1:
                     st.download_button(
                         label="💾 Download CSV (Standard)",
-                        data=csv,
-                        file_name=f"{topic.replace(' ', '_')}_pubmed_gaps.csv",
+                        data=lambda: export_results_csv(csv_path),
+                        file_name=f"{file_stem}.csv",
                         mime="text/csv",
                         type="primary",
+                        on_click="ignore",
                         use_container_width=True
                     )
                 
-                # Create a JSON version additional download option
-                json_data = df.to_json(orient='records', indent=2).encode('utf-8')
                 with dl_col2:
                     st.download_button(
                         label="💾 Download JSON (Detailed)",
-                        data=json_data,
-                        file_name=f"{topic.replace(' ', '_')}_pubmed_gaps.json",
+                        data=lambda: export_results_json(csv_path),
+                        file_name=f"{file_stem}.json",
                         mime="application/json",
                         type="secondary",
+                        on_click="ignore",
                         use_container_width=True
                     )
                 
+                with dl_col3:
+                    st.download_button(
+                        label="🗜️ Download JSONL (gzip)",
+                        data=lambda: export_results_jsonl_gz(csv_path),
+                        file_name=f"{file_stem}.jsonl.gz",
+                        mime="application/gzip",
+                        type="secondary",
+                        on_click="ignore",
+                        use_container_width=True
+                    )
+                
+                with dl_col4:
+                    if PARQUET_AVAILABLE:
+                        st.download_button(
+                            label="📦 Download Parquet",
+                            data=lambda: export_results_parquet(csv_path),
+                            file_name=f"{file_stem}.parquet",
+                            mime="application/vnd.apache.parquet",
+                            type="secondary",
+                            on_click="ignore",
+                            use_container_width=True
+                        )
+                    else:
+                        st.caption("Install `pyarrow` to enable Parquet export")
+                
                 st.markdown("---")
                 st.success("✅ PubMed analysis complete! Download your results above.")
         
+        if prefetch_executor:
+            prefetch_executor.shutdown(wait=False, cancel_futures=True)
         st.session_state.experiment_running = False
 
 if __name__ == "__main__":